@@ -1,116 +1,187 @@
 """JSON investigator."""
 import json
-import logging
 import argparse
+from collections import deque
 from my_logger import get_logger
 
+try:
+    # https://pypi.org/project/ijson/ - used to stream large QCONF files without loading them to memory
+    import ijson
+except ModuleNotFoundError:
+    ijson = None
+try:
+    # https://pypi.org/project/orjson/ - much faster parser than stdlib json, used when not streaming
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
 logger = get_logger('digson')
-logger.setLevel('DEBUG')
 
+# mapping between ijson scalar event names and type names shown in UML blocks
+_SCALAR_TYPES = {'string': 'str', 'integer': 'int', 'double': 'float',
+                 'boolean': 'bool', 'null': 'NoneType'}
 
-class Parser:
-    """
-    Parse input JSON reading all keys and obtaining their types.
 
-    This class parse JSON file recursivly visiting all keys and building PlantUml scheme.
+def _scalar_name(event, value):
+    """Return type name for UML block from ijson scalar event (some backends emit generic `number`)."""
+    if event == 'number':
+        return 'int' if isinstance(value, int) else 'float'
+    return _SCALAR_TYPES[event]
 
-    Use `Parser.create(qjson, handle)` to get first instance.
 
+def _unravel(data):
     """
+    Find datatype for nested lists (like arrays).
 
-    _level = 0  # level of nesting
-    _handle = None  # handle of file to write output
-
-    def __init__(self, qjson, instance, rootname):
-        """
-        Create instance.
-
-        Use `Parser.create(qjson, handle)` to get first instance.
-
-        Args:
-            qjson:  a branch of json object (`qjson = json.load(file)`)
-            instance: unique number of instance. First must have 0
-            rootname: name of the key of qjson branch
-        """
-        self._root = qjson
-        self._keys = self._root.keys()
-        self._types = [type(self._root.get(x)) for x in self._keys]
-        # descriptive name of the type for UML (can be modified in decode())
-        self._desctype = [type(self._root.get(x)).__name__ for x in self._keys]
-        self._instance = instance  # count instances, we need to know which is 0 to close uml section
-        self._rootname = rootname  # root of json we process now (key)
-        Parser._level += 1
-        self.decode()
-        self._write_block()  # write current block at the end, decode() can modify _desctype
-
-    @classmethod
-    def create(cls, qjson, handle):
-        """
-        Create instance of Parser.
-
-        Args:
-            qjson: json object read as: (`qjson = json.load(file)`)
-            handle: handle to file where PlantUml script is written. File should be opened with 'w'
-        """
-        Parser._handle = handle
-        Parser._handle.write("@startuml\n")
-        cls(qjson, 0, 'root')
-
-    def __del__(self):
-        """Add PlantUml tag at the end."""
-        if self._instance == 0:
-            Parser._handle.write("@enduml\n")
-
-    def decode(self):
-        """Process keys from current level recursively."""
-        for i, (k, t) in enumerate(zip(self._keys, self._types)):  # along keys for current level
-            logger.debug('Key {} type {} level {}'.format(k, t.__name__, Parser._level))
-            if t == dict:  # go deeper
-                self.parser = Parser(self._root.get(k), self._instance+1, k)  # parse key for current level
-                self._write_connection(self._rootname, k, '--')  # connect this instance with that processed one
-            elif t == list:  # check what is first list element and then decide
-                el, listType, lev = self._unravel(self._root.get(k))  # get type of list elements (all the same assumed)
-                self._desctype[i] = 'list{}[{}]'.format(
-                    '[]'*(lev-1), listType.__name__)  # modify descriptive type for UML (for class block)
-                if listType == dict:  # if it is list of objects
-                    self.parser = Parser(el, self._instance+1, k)  # go deeper
-                    self._write_connection(self._rootname, k, '..', 'el{}[0]'.format('[]'*(lev-1)))
-                else:  # nothing to do here, primitive arrays are marked in class block (_desctype)
-                    logger.debug("\t List type {}, lev {}".format(listType.__name__, lev))
-
-    def _unravel(self, data):
-        """Find datatype for nested lists (like arrays)."""
-        _l = data
-        lev = 0
-        while type(_l) is list and len(_l) > 0:
-            _l = _l[0]
-            lev += 1
-        if type(_l) is list:  # must be empty then
+    Only first elements are followed (all elements are assumed to be the same), so the cost is
+    the nesting depth of the list, never its size.
+    """
+    lev = 0
+    while type(data) is list:
+        if not data:  # empty list - no leaf to report
             return None
-        else:
-            return _l, type(_l), lev
+        data = data[0]
+        lev += 1
+    return data, type(data), lev
+
 
-    def _write_connection(self, source, dest, connection, note=''):
-        if not note:
-            Parser._handle.write('{} {} {}\n'.format(source, connection, dest))
-        else:
-            Parser._handle.write('{} {} {}: {}\n'.format(source, connection, dest, note))
+def _write_connection(buf, source, dest, connection, note=''):
+    if not note:
+        buf.append(f'{source} {connection} {dest}\n')
+    else:
+        buf.append(f'{source} {connection} {dest}: {note}\n')
 
-    def _write_block(self):
-        """Write class block."""
-        Parser._handle.write('class {} {{\n'.format(self._rootname))
-        for k, t in zip(self._keys, self._desctype):
-            Parser._handle.write('\t+{} : {}\n'.format(k, t))
-        Parser._handle.write('}\n')
+
+def _write_block(buf, rootname, keys, desctypes):
+    """Write class block (one buffer entry per block)."""
+    body = ''.join(f'\t+{k} : {t}\n' for k, t in zip(keys, desctypes))
+    buf.append(f'class {rootname} {{\n{body}}}\n')
+
+
+def walk(qjson, handle):
+    """
+    Parse input JSON reading all keys and obtaining their types.
+
+    Visits all keys of the json tree and builds PlantUml scheme. Nodes wait on an explicit
+    work-queue instead of spawning one parser object per nested dict as the former recursive
+    implementation did.
+
+    Args:
+        qjson: json object read as: (`qjson = json.load(file)`)
+        handle: handle to file where PlantUml script is written. File should be opened with 'w'
+    """
+    buf = ['@startuml\n']  # output lines buffered here and written in one go at the end
+    queue = deque([(qjson, 'root', 0)])  # (branch of json object, name of its key, level of nesting)
+    while queue:
+        node, rootname, level = queue.popleft()
+        keys = []
+        desctypes = []  # descriptive name of the type for UML (modified for lists below)
+        for k, v in node.items():  # along keys for current level
+            t = type(v)
+            # %-style args are formatted by logging only when DEBUG is actually enabled
+            logger.debug('Key %s type %s level %s', k, t.__name__, level)
+            keys.append(k)
+            if t is dict:  # go deeper
+                queue.append((v, k, level+1))
+                _write_connection(buf, rootname, k, '--')  # connect this block with the queued one
+                desctypes.append(t.__name__)
+            elif t is list:  # check what is first list element and then decide
+                el, listType, lev = _unravel(v)  # get type of list elements (all the same assumed)
+                desctypes.append(f"list{'[]'*(lev-1)}[{listType.__name__}]")
+                if listType is dict:  # if it is list of objects
+                    queue.append((el, k, level+1))  # go deeper
+                    _write_connection(buf, rootname, k, '..', f"el{'[]'*(lev-1)}[0]")
+                else:  # nothing to do here, primitive arrays are marked in class block (desctypes)
+                    logger.debug("\t List type %s, lev %s", listType.__name__, lev)
+            else:
+                desctypes.append(t.__name__)
+        _write_block(buf, rootname, keys, desctypes)
+    buf.append('@enduml\n')
+    handle.write(''.join(buf))
+
+
+def stream_decode(events, handle):
+    """
+    Build the same PlantUml scheme as :func:`walk` from a stream of *ijson* events.
+
+    Instead of materializing the whole json tree in memory, the stream of ``(prefix, event, value)``
+    tuples produced by `ijson.parse` is consumed in a single pass. Only keys and types are collected
+    and list bodies are fast-forwarded once the type of their first element is known (all elements
+    are assumed to be the same, see :func:`_unravel`), so peak memory depends on nesting
+    depth only, not on file size.
+
+    Args:
+        events: iterator of events obtained from `ijson.parse(file)`
+        handle: handle to file where PlantUml script is written. File should be opened with 'w'
+    """
+    buf = ['@startuml\n']  # output lines buffered here and written in one go at the end
+    frames = []  # one frame per open object: [rootname, keys, desctypes, connection, skip_after]
+    arrays = []  # one state per open list waiting for its first element: [key, lev, owner frame]
+    key = 'root'  # name of the key whose value comes next
+    skip = 0  # number of unclosed maps/lists being fast-forwarded
+    for _, event, value in events:
+        if skip:  # remainder of an already classified list, count containers only
+            if event == 'start_map' or event == 'start_array':
+                skip += 1
+            elif event == 'end_map' or event == 'end_array':
+                skip -= 1
+            continue
+        if event == 'map_key':
+            key = value
+        elif event == 'start_map':
+            if arrays:  # list of objects - classify it and descend into the first element only
+                k, lev, frame = arrays.pop()
+                frame[2][-1] = f"list{'[]'*(lev-1)}[dict]"
+                frames.append([k, [], [], (frame[0], k, '..', f"el{'[]'*(lev-1)}[0]"), lev])
+            elif frames:  # value of `key` in enclosing object - go deeper
+                frames[-1][1].append(key)
+                frames[-1][2].append('dict')
+                frames.append([key, [], [], (frames[-1][0], key, '--', ''), 0])
+            else:  # root object
+                frames.append(['root', [], [], None, 0])
+        elif event == 'end_map':
+            rootname, keys, desctypes, conn, skip = frames.pop()
+            _write_block(buf, rootname, keys, desctypes)
+            if conn:
+                _write_connection(buf, *conn)
+        elif event == 'start_array':
+            if arrays:  # first element is a list itself - same pending list, one level deeper
+                arrays[-1][1] += 1
+            else:  # leaf type not known yet, record key with placeholder modified on classification
+                frames[-1][1].append(key)
+                frames[-1][2].append('list')
+                arrays.append([key, 1, frames[-1]])
+        elif event == 'end_array':
+            if arrays:  # list (or its first element) turned out to be empty - leave placeholder
+                k, lev, frame = arrays.pop()
+                skip = lev - 1
+        else:  # scalar - either leaf of a pending list or plain value of `key`
+            if arrays:
+                k, lev, frame = arrays.pop()
+                listType = _scalar_name(event, value)
+                frame[2][-1] = f"list{'[]'*(lev-1)}[{listType}]"
+                logger.debug("\t List type %s, lev %s", listType, lev)
+                skip = lev  # fast-forward remaining elements and closing brackets
+            else:
+                frames[-1][1].append(key)
+                frames[-1][2].append(_scalar_name(event, value))
+    buf.append('@enduml\n')
+    handle.write(''.join(buf))
 
 
 if __name__ == '__main__':
+    logger.setLevel('DEBUG')  # verbose only when run as a tool, importers keep the default level
     parser = argparse.ArgumentParser()
     parser.add_argument('--qconf', required=True, help='QCONF file to analyse')
     parser.add_argument('--out', required=True, help='Output file with UML definition')
     args = parser.parse_args()
-    with open(args.qconf) as js:
-        qjson = json.load(js)
-        with open(args.out, 'w') as out:
-            p = Parser.create(qjson, out)
+    with open(args.out, 'w') as out:
+        if ijson is not None:  # stream the file, peak memory does not depend on its size
+            with open(args.qconf, 'rb') as js:
+                stream_decode(ijson.parse(js), out)
+        else:  # fall back to materializing the whole tree
+            with open(args.qconf, 'rb') as js:
+                # orjson parses number-heavy QCONF files several times faster than stdlib json
+                qjson = orjson.loads(js.read()) if orjson is not None else json.load(js)
+                walk(qjson, out)
     print('Call ''java -jar plantuml.jar {}'' to get UML plot'.format(args.out))
@@ -17,19 +17,18 @@ def get_logger(name):
     :return: Instance of the logger
     :rtype: :class:`logging.Logger`
     """
-    global loggers
-    if _loggers.get(name):
-        return _loggers.get(name)
-    else:
-        logger = logging.getLogger(name)
-        if logger.hasHandlers():
-            logger.handlers.clear()
-        logger.setLevel(logging.ERROR)
-        formatter = logging.Formatter('[%(levelname)s] - %(name)s - %(message)s')
-        ch = logging.StreamHandler()
-        ch.setFormatter(formatter)
-        ch.setLevel(logging.NOTSET)
-        logger.addHandler(ch)
-        logger.propagate = False
-        _loggers[name] = logger
+    logger = _loggers.get(name)
+    if logger is not None:
+        return logger
+    logger = logging.getLogger(name)
+    if logger.hasHandlers():
+        logger.handlers.clear()
+    logger.setLevel(logging.ERROR)
+    formatter = logging.Formatter('[%(levelname)s] - %(name)s - %(message)s')
+    ch = logging.StreamHandler()
+    ch.setFormatter(formatter)
+    ch.setLevel(logging.NOTSET)
+    logger.addHandler(ch)
+    logger.propagate = False
+    _loggers[name] = logger
     return logger
@@ -10,16 +10,29 @@
 # %% Some imports
 import os
 import json
+import mmap
+import itertools
 import numpy as np
 import matplotlib.pyplot as plt
 import skimage.io as io
-import csv
 try:
     # https://github.com/dunovank/jupyter-themes
     from jupyterthemes import jtplot
     jtplot.style(theme='grade3')
 except ModuleNotFoundError:
     pass
+try:
+    # https://pypi.org/project/ijson/ - if available the big maps are streamed from the file straight
+    # into numpy arrays instead of being materialized as list[][] of Python floats first
+    import ijson
+except ModuleNotFoundError:
+    ijson = None
+try:
+    # https://pypi.org/project/orjson/ - much faster QCONF parsing, fed from mmap below so the file
+    # is paged in lazily by the OS and never copied into an intermediate Python str
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
 # %% [markdown]
 # # Accessing QCONF data
 #
@@ -61,6 +74,42 @@ except ModuleNotFoundError:
 # %%
 
 
+# Markers for positions in keyMap paths that `it` replaces with the requested list indexes
+# (cellNo and fluoCh respectively).
+CELL = object()
+FLUO = object()
+
+# This dict creates mapping between short convenient name and path of object names in json we have to traverse
+# to reach specified data. It is built once at import time, `it` only substitutes the CELL/FLUO markers with
+# the requested indexes while traversing (building the whole dict on every call was measurable in hot loops).
+keyMap = {
+    # date of creation of QCONF
+    'QDATE': ['createdOn'],
+    # absolute path to image (path from the system where QCONF was created)
+    'QIMAGE': ['obj', 'BOAState', 'boap', 'orgFile', 'path'],
+    'QFRAME': ['obj', 'BOAState', 'boap', 'FRAMES'],
+    'QSNAKES': ['obj', 'BOAState', 'nest', 'sHs'],
+    'FINALS': 'finalSnakes',
+    'BOUNDS': 'bounds',
+    'CENTROID': 'centroid',
+    'QSTATE': ['obj', 'QState'],
+    # int: time resolution of map
+    'MAPT': ['obj', 'QState', CELL, 'T'],
+    # int: outline resolution of map
+    'MAPR': ['obj', 'QState', CELL, 'res'],
+    # array[MAPT][MAPR]: motility map
+    'MOTMAP': ['obj', 'QState', CELL, 'motMap'],
+    # array[MAPT][MAPR]: convexity map
+    'CONMAP': ['obj', 'QState', CELL, 'convMap'],
+    # list of the 3 fluorescence channel objects of a cell
+    'FLUMAPS': ['obj', 'QState', CELL, 'fluoMaps'],
+    # array[MAPT][MAPR]: fluorescence map
+    'FLUMAP': ['obj', 'QState', CELL, 'fluoMaps', FLUO, 'map'],
+    # bool: True if map enabled
+    'FLUMAPSTATUS': ['obj', 'QState', CELL, 'fluoMaps', FLUO, 'enabled']
+}
+
+
 def it(jn, name, cellNo=0, fluoCh=0):
     """
     Return value for given name from keyMap.
@@ -77,43 +126,63 @@ def it(jn, name, cellNo=0, fluoCh=0):
         Value for `name` key from QCONF (as Python datatype).
 
     """
-    # This dict creates mapping between short convenient name and path of object names in json we have to traverse
-    # to reach specified data.
-    keyMap = {
-        # date of creation of QCONF
-        'QDATE': ['createdOn'],
-        # absolute path to image (path from the system where QCONF was created)
-        'QIMAGE': ['obj', 'BOAState', 'boap', 'orgFile', 'path'],
-        'QFRAME': ['obj', 'BOAState', 'boap', 'FRAMES'],
-        'QSNAKES': ['obj', 'BOAState', 'nest', 'sHs'],
-        'FINALS': 'finalSnakes',
-        'BOUNDS': 'bounds',
-        'CENTROID': 'centroid',
-        'QSTATE': ['obj', 'QState'],
-        # int: time resolution of map
-        'MAPT': ['obj', 'QState', f"{cellNo}", 'T'],
-        # int: outline resolution of map
-        'MAPR': ['obj', 'QState', f"{cellNo}", 'res'],
-        # array[MAPT][MAPR]: motility map
-        'MOTMAP': ['obj', 'QState', f"{cellNo}", 'motMap'],
-        # array[MAPT][MAPR]: convexity map
-        'CONMAP': ['obj', 'QState', f"{cellNo}", 'convMap'],
-        # array[MAPT][MAPR]: fluorescence map
-        'FLUMAP': ['obj', 'QState', f"{cellNo}", 'fluoMaps', f"{fluoCh}", 'map'],
-        # bool: True if map enabled
-        'FLUMAPSTATUS': ['obj', 'QState', f"{cellNo}", 'fluoMaps', f"{fluoCh}", 'enabled']
-    }
     ans = jn
     keys = keyMap[name]
     # iterate over key tree towards data
     for k in keys:
-        if k.isdigit():  # next object is list not class
-            k = int(k)
+        if k is CELL:  # next object is list not class, take requested element
+            k = int(cellNo)
+        elif k is FLUO:
+            k = int(fluoCh)
         ans = ans[k]
 
     return ans
 
 
+# ijson prefixes of the flat number streams for the big maQP maps. `item` matches every list element,
+# so one stream contains the maps of all cells (and all channels for FLUMAP) one after another.
+mapPrefix = {
+    'MOTMAP': 'obj.QState.item.motMap.item.item',
+    'CONMAP': 'obj.QState.item.convMap.item.item',
+    'FLUMAP': 'obj.QState.item.fluoMaps.item.map.item.item',
+}
+
+
+def load_map(path, jn, name, cellNo=0, fluoCh=0):
+    """
+    Load one of the big maQP maps as 2-D np.array of floats.
+
+    Plain `np.array(it(jn, name, ...))` materializes the map twice - first as `list[MAPT][MAPR]` of
+    boxed Python floats (28 B each) and then as the ndarray. When *ijson* is available the numbers
+    are streamed from the file directly into the array instead, so only 8 B per value is allocated.
+
+    Args:
+        path:   path to the QCONF file
+        jn:     the same QCONF as dict (used to read map dimensions and as fallback without ijson)
+        name:   'MOTMAP', 'CONMAP' or 'FLUMAP'
+        cellNo: number of cell
+        fluoCh: fluorescence channel number (FLUMAP only)
+
+    Returns:
+        Map as 2-D np.array of shape [MAPT][MAPR].
+
+    """
+    if ijson is None:
+        return np.array(it(jn, name, cellNo=cellNo, fluoCh=fluoCh))
+    # number of values to skip in the flat stream - maps of preceding cells (x3 channels for FLUMAP)
+    first = sum(it(jn, 'MAPT', cellNo=c) * it(jn, 'MAPR', cellNo=c)
+                for c in range(cellNo)) * (3 if name == 'FLUMAP' else 1)
+    mapT = it(jn, 'MAPT', cellNo=cellNo)
+    mapR = it(jn, 'MAPR', cellNo=cellNo)
+    if name == 'FLUMAP':
+        first += fluoCh * mapT * mapR
+    with open(path, 'rb') as f:
+        values = ijson.items(f, mapPrefix[name], use_float=True)
+        flat = np.fromiter(itertools.islice(values, first, first + mapT * mapR),
+                           dtype=np.float64, count=mapT * mapR)
+    return flat.reshape(mapT, mapR)
+
+
 # %% [markdown]
 # ## Reading basic data from QCONF
 #
@@ -128,8 +197,11 @@ def it(jn, name, cellNo=0, fluoCh=0):
 path = 'data/Stack.QCONF' if os.path.exists('data/Stack.QCONF') else '../data/Stack.QCONF'
 cell = 0  # cell number
 
-with open(path) as qconf:
-    dqconf = json.load(qconf)
+with open(path, 'rb') as qconf:
+    if orjson is not None:  # zero-copy parse straight from the memory-mapped file
+        dqconf = orjson.loads(memoryview(mmap.mmap(qconf.fileno(), 0, access=mmap.ACCESS_READ)))
+    else:
+        dqconf = json.load(qconf)
     # show some info
     print("*"*80)
     print("{} created at {}".format(os.path.basename(path), dqconf['createdOn']))
@@ -138,18 +210,16 @@ with open(path) as qconf:
     print(f"Maps for cell {cell}")
     print("\tMaps size [Frames x Points] {}x{}".format(it(dqconf, 'MAPT', cellNo=cell),
                                                        it(dqconf, 'MAPR', cellNo=cell)))
-    # look for fluorescence map - find channels
-    channels = []
-    for i in range(3):  # there are 3 channels, look for bool: enabled field
-        if it(dqconf, 'FLUMAPSTATUS', cellNo=cell, fluoCh=i):
-            channels.append(i)
+    # look for fluorescence map - find channels with bool: enabled field set. One walk down to the
+    # fluoMaps subtree serves all 3 channels instead of three it() calls repeating it from the root.
+    channels = [i for i, fm in enumerate(it(dqconf, 'FLUMAPS', cellNo=cell)) if fm['enabled']]
     print("\tFluorescence maps enabled for channels {}:".format(channels))
     print("*"*80)
-    # load maps
-    motility = np.array(it(dqconf, 'MOTMAP', cellNo=0))
-    convexity = np.array(it(dqconf, 'CONMAP', cellNo=0))
+    # load maps (streamed into np.array when ijson is installed, see load_map)
+    motility = load_map(path, dqconf, 'MOTMAP', cellNo=0)
+    convexity = load_map(path, dqconf, 'CONMAP', cellNo=0)
     # get first available fluoMap
-    fluo = np.array(it(dqconf, 'FLUMAP', cellNo=0, fluoCh=channels[0]))
+    fluo = load_map(path, dqconf, 'FLUMAP', cellNo=0, fluoCh=channels[0])
     # load original image - QCONF stores full absolute path from the system where QCONF was created.
     # Ususally the image is in the same folder as QCONF.
     absImagePath = it(dqconf, 'QIMAGE')
@@ -187,18 +257,18 @@ with open(path) as qconf:
 # along time) or use *xMap* and *yMap* to convert from <frame;outline> space to Cartesian coordinates and plot tracks
 # in original sequence (more details [here](https://pilip.lnx.warwick.ac.uk/docs/develop/QuimP_Guide.html#x1-3000013)).
 #
-# In code below we read *tracks.csv* file and convert it to `list[][]`, where first dimension is the number of
-# tracked points * 4
+# In code below we read *tracks.csv* file and convert it to a list of integer `np.array`, where first dimension is
+# the number of tracked points * 4. Tracks are kept as `np.intp` arrays so that reversing (`[::-1]`) is a constant
+# time view and indexing maps with them does not convert a Python list on every use.
 # Note that tracked point (initial point we track in time) is repeated - it is first point of backward and forward track.
 # %%
 trackFile_path = 'data/tracks_0.csv' if os.path.exists('data/tracks_0.csv') else '../data/tracks_0.csv'
 i_tracks = []  # indexes of tracks, [num_of_points*4][indexes]
 with open(trackFile_path) as tracks:
-    lines = csv.reader(tracks)
-    for line in lines:
-        if not line[0].startswith('#'):  # comment
-            # reject first element which is Point number and convert to int
-            i_tracks.append(list(map(int, line[1:])))
+    for line in tracks:
+        if not line.startswith('#'):  # comment
+            # reject first element which is Point number, numpy converts the rest to ints at C level
+            i_tracks.append(np.fromstring(line.split(',', 1)[1], dtype=np.intp, sep=','))
 print("There are {} points in track file {}".format(len(i_tracks)//4, trackFile_path))
 
 # %% [markdown]